@@ -6,15 +6,46 @@ class Settings(BaseSettings):
     VECTOR_DB_TYPE: str = "qdrant"  # atau "chroma", "pinecone", dll
     QDRANT_HOST: str = "localhost"
     QDRANT_PORT: int = 6333
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_PREFER_GRPC: bool = True
+    HNSW_M: int = 24
+    HNSW_EF_CONSTRUCT: int = 128
+    HNSW_EF_SEARCH: int = 100
+    HNSW_FULL_SCAN_THRESHOLD: int = 10000
+    QDRANT_QUANTIZATION: str = "int8"  # atau "binary"
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0
+    QDRANT_UPLOAD_BATCH_SIZE: int = 256
+    QDRANT_UPLOAD_PARALLEL: int = 4
+    SEARCH_CACHE_SIZE: int = 1024
+    SEARCH_CACHE_TTL: int = 300  # detik
+    # Lokasi versi collection untuk invalidasi cache; "memory" hanya untuk
+    # satu worker (cache dimatikan jika WEB_CONCURRENCY > 1), "redis" dibagi semua worker
+    SEARCH_CACHE_BACKEND: str = "memory"
+    SEARCH_BATCH_MAX_SIZE: int = 64
+    SEARCH_BATCH_WINDOW_MS: float = 5.0
     
     # Embedding Config
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
     EMBEDDING_DIM: int = 384
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_QUERY_CACHE_SIZE: int = 4096
+    EMBEDDING_DEVICE: Optional[str] = None  # None = cuda jika tersedia, selain itu cpu
+    EMBEDDING_BACKEND: str = "torch"  # atau "onnx"
+    EMBEDDING_CPU_BF16: bool = False  # hanya untuk CPU dengan AVX-512 BF16/AMX
+    EMBEDDING_ONNX_FILE: Optional[str] = None
     
     # LLM Config
     LLM_PROVIDER: str = "ollama"  # atau "openai", "anthropic", dll
     LLM_MODEL: str = "llama3:8b"
     
+    # Server Config
+    WEB_CONCURRENCY: int = 1  # jumlah worker uvicorn (env yang sama dibaca uvicorn)
+
+    # Conversation Config
+    CONVERSATION_BACKEND: str = "memory"  # atau "redis" (wajib jika worker > 1)
+    CONVERSATION_TTL: int = 3600  # detik
+    REDIS_URL: str = "redis://localhost:6379/0"
+
     # Processing Config
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
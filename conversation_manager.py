@@ -1,80 +1,215 @@
+import heapq
+import time
 import uuid
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from config import settings
+from interfaces import ConversationStoreInterface
+
+
+@dataclass(slots=True)
+class Message:
+    role: str
+    content: str
+    timestamp: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp,
+            "metadata": self.metadata
+        }
+
 
+class ConversationManager(ConversationStoreInterface):
+    """In-memory store, hanya untuk satu proses (development / satu worker)"""
 
-class ConversationManager:
-    def __init__(self, max_history_per_conversation: int = 10, conversation_ttl: int = 3600):
-        self.conversations: Dict[str, Dict] = {}
+    def __init__(self, max_history_per_conversation: int = 10, conversation_ttl: int = 3600,
+                 max_conversations: int = 10000):
+        # Urutan LRU: conversation yang paling lama tidak dipakai di depan
+        self.conversations: "OrderedDict[str, Dict]" = OrderedDict()
         self.max_history = max_history_per_conversation
         self.conversation_ttl = conversation_ttl
-
-    def create_conversation(self) -> str:
+        self.max_conversations = max_conversations
+        # Min-heap (expires_at, conversation_id), entry usang dibuang secara lazy
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._expires_at: Dict[str, float] = {}
+
+    def _touch(self, conversation_id: str, now: float):
+        """Refresh TTL dan posisi LRU"""
+        expires_at = now + self.conversation_ttl
+        self._expires_at[conversation_id] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, conversation_id))
+        self.conversations.move_to_end(conversation_id)
+
+    async def create_conversation(self) -> str:
         """Create new conversation"""
         conversation_id = str(uuid.uuid4())
+        now = time.time()
+        self.cleanup_expired_conversations(now)
+
         self.conversations[conversation_id] = {
             "id": conversation_id,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now(),
-            "messages": []
+            "created_at": now,
+            "updated_at": now,
+            # deque dengan maxlen otomatis membuang pesan tertua
+            "messages": deque(maxlen=self.max_history)
         }
+        self._touch(conversation_id, now)
+
+        # Evict conversation yang paling lama tidak dipakai
+        while len(self.conversations) > self.max_conversations:
+            evicted_id, _ = self.conversations.popitem(last=False)
+            self._expires_at.pop(evicted_id, None)
         return conversation_id
 
-    def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+    async def get_conversation(self, conversation_id: str) -> Optional[Dict]:
         """Get conversation by ID"""
-        return self.conversations.get(conversation_id)
+        conversation = self.conversations.get(conversation_id)
+        if conversation is not None:
+            self.conversations.move_to_end(conversation_id)
+        return conversation
 
-    def add_message(self, conversation_id: str, role: str, content: str, metadata: Optional[Dict] = None):
+    async def add_message(self, conversation_id: str, role: str, content: str, metadata: Optional[Dict] = None):
         """Add message to conversation"""
         if conversation_id not in self.conversations:
             return  # Conversation tidak ditemukan
 
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now(),
-            "metadata": metadata or {}
-        }
+        now = time.time()
+        message = Message(role, content, now, metadata or {})
 
         self.conversations[conversation_id]["messages"].append(message)
-        self.conversations[conversation_id]["updated_at"] = datetime.now()
+        self.conversations[conversation_id]["updated_at"] = now
+        self._touch(conversation_id, now)
 
-        # Trim history jika melebihi batas
-        if len(self.conversations[conversation_id]["messages"]) > self.max_history:
-            self.conversations[conversation_id]["messages"] = self.conversations[conversation_id]["messages"][-self.max_history:]
+    async def add_message_pair(self, conversation_id: str, user_content: str, user_metadata: Optional[Dict],
+                               assistant_content: str, assistant_metadata: Optional[Dict]):
+        """Add user question + assistant answer sekaligus, urutan selalu terjaga"""
+        if conversation_id not in self.conversations:
+            return  # Conversation tidak ditemukan
 
-    def get_conversation_history(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict]:
+        now = time.time()
+        messages = self.conversations[conversation_id]["messages"]
+        messages.append(Message("user", user_content, now, user_metadata or {}))
+        messages.append(Message("assistant", assistant_content, now, assistant_metadata or {}))
+        self.conversations[conversation_id]["updated_at"] = now
+        self._touch(conversation_id, now)
+
+    async def get_conversation_history(self, conversation_id: str, limit: Optional[int] = None) -> List[Message]:
         """Get conversation history (internal use only)"""
         if conversation_id not in self.conversations:
             return []
 
         messages = self.conversations[conversation_id]["messages"]
         if limit:
-            return messages[-limit:]
-        return messages
+            return list(islice(messages, max(0, len(messages) - limit), len(messages)))
+        return list(messages)
 
-    def get_recent_context(self, conversation_id: str, max_messages: int = 3) -> List[Dict]:
-        """Get recent messages for context (internal use only)"""
-        return self.get_conversation_history(conversation_id, max_messages)
-
-    def conversation_exists(self, conversation_id: str) -> bool:
+    async def conversation_exists(self, conversation_id: str) -> bool:
         """Check if conversation exists"""
+        self.cleanup_expired_conversations()
         return conversation_id in self.conversations
 
-    def cleanup_expired_conversations(self):
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete conversation, False jika tidak ditemukan"""
+        if self.conversations.pop(conversation_id, None) is None:
+            return False
+        self._expires_at.pop(conversation_id, None)
+        return True
+
+    def cleanup_expired_conversations(self, now: Optional[float] = None) -> int:
         """Clean up expired conversations"""
-        now = datetime.now()
-        expired_ids = []
+        now = now or time.time()
+        cleaned = 0
+
+        # Hanya entry yang sudah lewat TTL yang disentuh, O(log N) per entry
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            expires_at, conv_id = heapq.heappop(self._expiry_heap)
+            # Lewati entry usang (conversation sudah di-refresh atau di-evict)
+            if self._expires_at.get(conv_id) != expires_at:
+                continue
+            del self._expires_at[conv_id]
+            del self.conversations[conv_id]
+            cleaned += 1
 
-        for conv_id, conv_data in self.conversations.items():
-            if now - conv_data["updated_at"] > timedelta(seconds=self.conversation_ttl):
-                expired_ids.append(conv_id)
+        return cleaned
 
-        for conv_id in expired_ids:
-            del self.conversations[conv_id]
 
-        return len(expired_ids)
+class RedisConversationManager(ConversationStoreInterface):
+    """Store di Redis: bertahan saat restart dan bisa dipakai banyak worker"""
+
+    def __init__(self, redis_url: str, max_history_per_conversation: int = 10, conversation_ttl: int = 3600):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(redis_url)
+        self.max_history = max_history_per_conversation
+        self.conversation_ttl = conversation_ttl
+
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}"
+
+    async def create_conversation(self) -> str:
+        """Create new conversation"""
+        # Key dibuat saat pesan pertama disimpan
+        return str(uuid.uuid4())
+
+    async def add_message(self, conversation_id: str, role: str, content: str, metadata: Optional[Dict] = None):
+        """Add message to conversation"""
+        message = Message(role, content, time.time(), metadata or {})
+        await self._append(conversation_id, message)
+
+    async def add_message_pair(self, conversation_id: str, user_content: str, user_metadata: Optional[Dict],
+                               assistant_content: str, assistant_metadata: Optional[Dict]):
+        """Add user question + assistant answer sekaligus, urutan selalu terjaga"""
+        now = time.time()
+        await self._append(
+            conversation_id,
+            Message("user", user_content, now, user_metadata or {}),
+            Message("assistant", assistant_content, now, assistant_metadata or {})
+        )
+
+    async def _append(self, conversation_id: str, *messages: Message):
+        key = self._key(conversation_id)
+
+        # Append, trim ke max_history, dan refresh TTL dalam satu round-trip
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(orjson.dumps(message.to_dict()) for message in messages))
+            pipe.ltrim(key, -self.max_history, -1)
+            pipe.expire(key, self.conversation_ttl)
+            await pipe.execute()
+
+    async def get_conversation_history(self, conversation_id: str, limit: Optional[int] = None) -> List[Message]:
+        """Get conversation history (internal use only)"""
+        start = -limit if limit else 0
+        raw_messages = await self.redis.lrange(self._key(conversation_id), start, -1)
+        return [Message(**orjson.loads(raw)) for raw in raw_messages]
+
+    async def conversation_exists(self, conversation_id: str) -> bool:
+        """Check if conversation exists"""
+        return await self.redis.exists(self._key(conversation_id)) > 0
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete conversation, False jika tidak ditemukan"""
+        return await self.redis.delete(self._key(conversation_id)) > 0
+
+
+def create_conversation_manager() -> ConversationStoreInterface:
+    backend = settings.CONVERSATION_BACKEND
+
+    if backend == "memory":
+        return ConversationManager(conversation_ttl=settings.CONVERSATION_TTL)
+    if backend == "redis":
+        return RedisConversationManager(settings.REDIS_URL, conversation_ttl=settings.CONVERSATION_TTL)
+    raise ValueError(f"Unsupported conversation backend: {backend}")
 
 
 # Global instance
-conversation_manager = ConversationManager()
+conversation_manager = create_conversation_manager()
@@ -1,35 +1,278 @@
 from interfaces import VectorDBInterface, EmbeddingInterface
 from config import settings
-from typing import List, Dict
-import uuid
-from qdrant_client.models import Distance, PointStruct, VectorParams, MatchValue, FieldCondition, Filter
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import threading
+import numpy as np
+from cachetools import LRUCache, TTLCache
+from qdrant_client.models import (
+    Batch, Distance, VectorParams, MatchValue, FieldCondition, Filter,
+    HnswConfigDiff, QueryRequest, ScoredPoint,
+    BinaryQuantization, BinaryQuantizationConfig,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams
+)
+
+logger = logging.getLogger(__name__)
+
+# Cache hasil search lintas instance, key menyertakan versi collection
+# sehingga add_documents cukup menaikkan versi untuk invalidasi
+_search_cache = TTLCache(maxsize=settings.SEARCH_CACHE_SIZE,
+                         ttl=settings.SEARCH_CACHE_TTL)
+_search_cache_lock = threading.Lock()
+
+
+class _LocalCollectionVersions:
+    """Versi collection di memori proses, hanya valid untuk satu worker"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, collection_name: str) -> int:
+        with self._lock:
+            return self._versions.get(collection_name, 0)
+
+    def bump(self, collection_name: str):
+        with self._lock:
+            self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+
+    async def abump(self, collection_name: str):
+        self.bump(collection_name)
+
+
+class _RedisCollectionVersions:
+    """Versi collection di Redis, upload di satu worker ikut meng-invalidate worker lain"""
+
+    def __init__(self, redis_url: str):
+        import redis
+        import redis.asyncio as aioredis
+
+        self.redis = redis.from_url(redis_url)
+        self.async_redis = aioredis.from_url(redis_url)
+
+    @staticmethod
+    def _key(collection_name: str) -> str:
+        return f"search_version:{collection_name}"
+
+    async def get(self, collection_name: str) -> int:
+        return int(await self.async_redis.get(self._key(collection_name)) or 0)
+
+    def bump(self, collection_name: str):
+        self.redis.incr(self._key(collection_name))
+
+    async def abump(self, collection_name: str):
+        await self.async_redis.incr(self._key(collection_name))
+
+
+def _create_collection_versions():
+    backend = settings.SEARCH_CACHE_BACKEND
+
+    if backend == "memory":
+        return _LocalCollectionVersions()
+    if backend == "redis":
+        return _RedisCollectionVersions(settings.REDIS_URL)
+    raise ValueError(f"Unsupported search cache backend: {backend}")
+
+
+_collection_versions = _create_collection_versions()
+# Versi di memori tidak terlihat worker lain: dengan beberapa worker,
+# cache hanya aman kalau versinya di Redis
+_search_cache_enabled = (settings.SEARCH_CACHE_SIZE > 0 and
+                         (settings.SEARCH_CACHE_BACKEND == "redis" or settings.WEB_CONCURRENCY <= 1))
+if not _search_cache_enabled and settings.SEARCH_CACHE_SIZE > 0:
+    logger.warning("Search cache disabled: WEB_CONCURRENCY > 1 requires SEARCH_CACHE_BACKEND=redis")
 
 
 class SentenceTransformerEmbedder(EmbeddingInterface):
     def __init__(self, model_name: str = None):
+        import torch
         from sentence_transformers import SentenceTransformer
+
+        # Bagi core antar worker uvicorn supaya intra-op thread torch
+        # tidak oversubscribe CPU
+        torch.set_num_threads(
+            max(1, (os.cpu_count() or 1) // max(1, settings.WEB_CONCURRENCY)))
+
+        self.device = settings.EMBEDDING_DEVICE or (
+            "cuda" if torch.cuda.is_available() else "cpu")
+
+        # Backend "onnx" (butuh sentence-transformers[onnx]) dengan file
+        # model int8, mis. onnx/model_qint8_avx512_vnni.onnx untuk CPU
+        model_kwargs = {}
+        if settings.EMBEDDING_BACKEND == "torch":
+            # Half precision: fp16 di GPU, bf16 opsional di CPU yang mendukung
+            if self.device == "cuda":
+                model_kwargs["torch_dtype"] = torch.float16
+            elif settings.EMBEDDING_CPU_BF16:
+                model_kwargs["torch_dtype"] = torch.bfloat16
+        elif settings.EMBEDDING_BACKEND == "onnx":
+            model_kwargs["provider"] = (
+                "CUDAExecutionProvider" if self.device == "cuda" else "CPUExecutionProvider")
+            if settings.EMBEDDING_ONNX_FILE:
+                model_kwargs["file_name"] = settings.EMBEDDING_ONNX_FILE
+
         self.model = SentenceTransformer(
-            model_name or settings.EMBEDDING_MODEL)
+            model_name or settings.EMBEDDING_MODEL,
+            device=self.device,
+            backend=settings.EMBEDDING_BACKEND,
+            model_kwargs=model_kwargs or None
+        )
+        self._inference_mode = torch.inference_mode
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        # Cache per instance, query yang sama tidak di-encode ulang.
+        # Bisa di-peek tanpa encode, jadi cache hit tidak perlu pindah thread
+        self._query_cache = LRUCache(maxsize=settings.EMBEDDING_QUERY_CACHE_SIZE)
+        self._query_cache_lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # SBERT mengurutkan input berdasarkan panjang dan membentuk
+        # mini-batch dengan panjang serupa, jadi padding minimal
+        with self._inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        # Model fp16 menghasilkan array fp16, Qdrant tetap menerima float32
+        return embeddings.astype(np.float32, copy=False)
+
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._encode(texts)
+
+    def cached_query(self, text: str) -> Optional[np.ndarray]:
+        with self._query_cache_lock:
+            return self._query_cache.get(text)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        embedding = self.cached_query(text)
+        if embedding is None:
+            embedding = self._encode([text])[0]
+            # Vektor di-share lewat cache, jangan sampai dimodifikasi caller
+            embedding.setflags(write=False)
+            with self._query_cache_lock:
+                self._query_cache[text] = embedding
+        return embedding
+
+
+def _document_id(text: str) -> int:
+    """ID deterministik dari isi dokumen, upload ulang jadi idempotent"""
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & ((1 << 63) - 1)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_qdrant_clients():
+    """Shared Qdrant clients, satu connection pool untuk semua collection"""
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+
+    # Client sync untuk setup collection dan ingest,
+    # client async (gRPC) untuk hot path search
+    client = QdrantClient(
+        host=settings.QDRANT_HOST,
+        port=settings.QDRANT_PORT,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC
+    )
+    async_client = AsyncQdrantClient(
+        host=settings.QDRANT_HOST,
+        port=settings.QDRANT_PORT,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC
+    )
+    return client, async_client
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self.model.encode(texts).tolist()
 
-    def embed_query(self, text: str) -> List[float]:
-        return self.model.encode([text]).tolist()[0]
+class BatchingSearcher:
+    """Gabungkan search yang datang bersamaan jadi satu query_batch_points"""
+
+    def __init__(self, async_client, collection_name: str, max_batch_size: int = 64,
+                 batch_window: float = 0.005):
+        self.async_client = async_client
+        self.collection_name = collection_name
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, request: QueryRequest) -> List[ScoredPoint]:
+        if self._worker is None or self._worker.done():
+            # Queue dan worker dibuat di event loop yang sedang berjalan
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch: List[Tuple[QueryRequest, asyncio.Future]] = [await self._queue.get()]
+            # Tunggu sebentar agar request lain ikut dalam batch yang sama
+            await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                responses = await self.async_client.query_batch_points(
+                    collection_name=self.collection_name,
+                    requests=[request for request, _ in batch]
+                )
+            except Exception as e:
+                if len(batch) == 1:
+                    _, future = batch[0]
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                # Satu request yang ditolak menggagalkan seluruh batch,
+                # ulangi per request supaya yang lain tidak ikut gagal
+                logger.warning("Batch search failed, retrying individually: %s", e)
+                await asyncio.gather(*(self._run_single(request, future)
+                                       for request, future in batch))
+                continue
+
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response.points)
+
+    async def _run_single(self, request: QueryRequest, future: asyncio.Future):
+        try:
+            response = await self.async_client.query_points(
+                collection_name=self.collection_name,
+                query=request.query,
+                query_filter=request.filter,
+                search_params=request.params,
+                limit=request.limit,
+                score_threshold=request.score_threshold,
+                with_payload=request.with_payload
+            )
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(response.points)
 
 
 class QdrantVectorDB(VectorDBInterface):
     def __init__(self, embedder: EmbeddingInterface, collection_name: str = None, similarity_threshold: float = 0.5):
-        from qdrant_client import QdrantClient
-        from qdrant_client.models import Distance, VectorParams
-
-        self.client = QdrantClient(
-            host=settings.QDRANT_HOST,
-            port=settings.QDRANT_PORT
-        )
+        self.client, self.async_client = _get_qdrant_clients()
         self.embedder = embedder
         self.collection_name = collection_name or "axel_base_knowledge"
         self.similarity_threshold = similarity_threshold
+        self._batcher = BatchingSearcher(
+            self.async_client,
+            self.collection_name,
+            max_batch_size=settings.SEARCH_BATCH_MAX_SIZE,
+            batch_window=settings.SEARCH_BATCH_WINDOW_MS / 1000
+        )
         self._create_collection()
 
     def _create_collection(self):
@@ -43,28 +286,104 @@ class QdrantVectorDB(VectorDBInterface):
                 vectors_config=VectorParams(
                     size=384,  # all-MiniLM-L6-v2 embedding size
                     distance=Distance.COSINE
+                ),
+                hnsw_config=HnswConfigDiff(
+                    m=settings.HNSW_M,
+                    ef_construct=settings.HNSW_EF_CONSTRUCT,
+                    full_scan_threshold=settings.HNSW_FULL_SCAN_THRESHOLD
+                ),
+                quantization_config=self._quantization_config()
+            )
+
+    @staticmethod
+    def _quantization_config():
+        """Quantization config untuk collection baru"""
+        if settings.QDRANT_QUANTIZATION == "binary":
+            # 1 bit per dimensi (32x lebih kecil), recall sangat bergantung
+            # pada rescore + oversampling untuk model berdimensi kecil
+            return BinaryQuantization(
+                binary=BinaryQuantizationConfig(always_ram=True)
+            )
+        if settings.QDRANT_QUANTIZATION == "int8":
+            # int8 di RAM: memori 4x lebih kecil, distance pakai SIMD int8
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True
                 )
             )
+        raise ValueError(f"Unsupported quantization: {settings.QDRANT_QUANTIZATION}")
+
+    async def get_collection_info(self):
+        """Get collection info (config, points count) from Qdrant"""
+        return await self.async_client.get_collection(self.collection_name)
 
     def add_documents(self, documents: List[str], metadata: List[dict]) -> None:
         embeddings = self.embedder.embed_documents(documents)
 
-        points = [
-            PointStruct(
-                id=str(uuid.uuid4()),
-                vector=embedding,
-                payload={"text": doc, "metadata": meta}
-            )
-            for doc, embedding, meta in zip(documents, embeddings, metadata)
-        ]
-
-        self.client.upsert(
+        # upload_collection menerima matrix numpy (N, dim) langsung dan
+        # mengirim per batch lewat beberapa worker
+        self.client.upload_collection(
             collection_name=self.collection_name,
-            points=points
+            vectors=embeddings,
+            payload=[{"text": doc, "metadata": meta}
+                     for doc, meta in zip(documents, metadata)],
+            ids=[_document_id(doc) for doc in documents],
+            batch_size=settings.QDRANT_UPLOAD_BATCH_SIZE,
+            parallel=settings.QDRANT_UPLOAD_PARALLEL,
+            # Tunggu sampai point bisa di-search, baru cache di-invalidate;
+            # kalau tidak, search di sela-selanya menyimpan hasil lama
+            # dengan key versi baru
+            wait=True
         )
+        _collection_versions.bump(self.collection_name)
+
+    async def aadd_documents(self, documents: List[str], metadata: List[dict]) -> None:
+        """Async ingest: embed di thread, upsert per batch lewat client async"""
+        embeddings = await asyncio.to_thread(self.embedder.embed_documents, documents)
+        ids = [_document_id(doc) for doc in documents]
+        payloads = [{"text": doc, "metadata": meta}
+                    for doc, meta in zip(documents, metadata)]
+
+        batch_size = settings.QDRANT_UPLOAD_BATCH_SIZE
+        semaphore = asyncio.Semaphore(settings.QDRANT_UPLOAD_PARALLEL)
+
+        async def upsert_batch(start: int):
+            end = start + batch_size
+            async with semaphore:
+                await self.async_client.upsert(
+                    collection_name=self.collection_name,
+                    points=Batch(
+                        ids=ids[start:end],
+                        vectors=embeddings[start:end].tolist(),
+                        payloads=payloads[start:end]
+                    ),
+                    # Batch jalan paralel, jadi wait=True tidak menambah
+                    # latency per batch secara berurutan
+                    wait=True
+                )
+
+        await asyncio.gather(*(upsert_batch(start)
+                               for start in range(0, len(documents), batch_size)))
+        # Semua batch sudah bisa di-search, baru hasil lama di-invalidate
+        await _collection_versions.abump(self.collection_name)
+
+    async def search(self, query: str, limit: int = 3, domain: str = None) -> List[Dict]:
+        cache_key = None
+        if _search_cache_enabled:
+            cache_key = (query, limit, domain, self.collection_name, self.similarity_threshold,
+                         await _collection_versions.get(self.collection_name))
+            with _search_cache_lock:
+                cached = _search_cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-    def search(self, query: str, limit: int = 3, domain: str = None) -> List[Dict]:
-        query_embedding = self.embedder.embed_query(query)
+        # Encode query CPU-bound, jalankan di thread agar event loop bebas
+        # (kecuali embedding-nya sudah ada di cache)
+        query_embedding = self.embedder.cached_query(query)
+        if query_embedding is None:
+            query_embedding = await asyncio.to_thread(self.embedder.embed_query, query)
 
         query_filter = None
         if domain:
@@ -77,46 +396,77 @@ class QdrantVectorDB(VectorDBInterface):
                 ]
             )
 
-        results = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=query_embedding,
+        # Di-batch bersama search lain yang datang di window yang sama
+        points = await self._batcher.submit(QueryRequest(
+            query=query_embedding.tolist(),
             limit=limit,
-            query_filter=query_filter
-        )
+            filter=query_filter,
+            # Kandidat dari vektor quantized di-rescore dengan vektor asli
+            params=SearchParams(
+                hnsw_ef=settings.HNSW_EF_SEARCH,
+                quantization=QuantizationSearchParams(
+                    ignore=False,
+                    rescore=True,
+                    oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+                )
+            ),
+            # Similarity threshold difilter langsung di Qdrant
+            score_threshold=self.similarity_threshold,
+            with_payload=True
+        ))
 
-        # Filter berdasarkan similarity threshold
-        filtered_results = [
+        results = [
             {
                 "text": result.payload["text"],
                 "metadata": result.payload.get("metadata", {}),
                 "score": result.score
             }
-            for result in results
-            # Hanya ambil yang similarity tinggi
-            if result.score >= self.similarity_threshold
+            for result in points
         ]
 
-        print(
-            f"Found {len(results)} results, {len(filtered_results)} after threshold filtering")
-        return filtered_results
+        logger.debug("Found %d results above threshold %.2f",
+                     len(results), self.similarity_threshold)
+
+        if cache_key is not None:
+            with _search_cache_lock:
+                _search_cache[cache_key] = results
+        return results
 
 
 # Factory untuk flexibility
 
 
+@functools.lru_cache(maxsize=1)
+def _get_embedder() -> EmbeddingInterface:
+    """Model embedding cukup di-load sekali per proses"""
+    return SentenceTransformerEmbedder()
+
+
 class VectorDBFactory:
     @staticmethod
     def create_vector_db(db_type: str = None, **kwargs) -> VectorDBInterface:
         db_type = db_type or settings.VECTOR_DB_TYPE
 
-        embedder = SentenceTransformerEmbedder()
-
         if db_type == "qdrant":
-            return QdrantVectorDB(embedder, **kwargs)
+            return QdrantVectorDB(_get_embedder(), **kwargs)
         # Tambahkan implementasi lain (Chroma, Pinecone, etc)
         else:
             raise ValueError(f"Unsupported vector DB: {db_type}")
 
 
-# Global instance dengan config
-vector_db = VectorDBFactory.create_vector_db()
+_db_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=32)
+def _get_db(collection: Optional[str]) -> VectorDBInterface:
+    if collection:
+        return VectorDBFactory.create_vector_db(collection_name=collection)
+    return VectorDBFactory.create_vector_db()
+
+
+def get_db(collection: Optional[str] = None) -> VectorDBInterface:
+    """Vector DB per collection (default jika None), satu instance per proses"""
+    # Dipanggil dari thread; lock mencegah dua thread membuat collection
+    # yang sama bersamaan
+    with _db_lock:
+        return _get_db(collection or None)
@@ -1,58 +1,80 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import IO, List, Union
+from functools import lru_cache
 import os
+import threading
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+@lru_cache(maxsize=32)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Splitter di-cache per kombinasi chunk_size/chunk_overlap"""
+    return RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ". ", " ", ""],
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
 
 class DocumentProcessor(ABC):
     @abstractmethod
-    def process(self, file_path: str) -> List[str]:
+    def process(self, file_or_path: Union[str, IO[bytes]]) -> List[str]:
         pass
 
 class TextProcessor(DocumentProcessor):
-    def process(self, file_path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+    def process(self, file_or_path: Union[str, IO[bytes]], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+        if isinstance(file_or_path, str):
+            with open(file_or_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        else:
+            text = file_or_path.read().decode('utf-8')
         
-        # Implement better chunking
         return self._split_text(text, chunk_size, chunk_overlap)
     
     def _split_text(self, text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-        # Implement recursive text splitter atau gunakan library
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            if end > len(text):
-                end = len(text)
-            chunks.append(text[start:end])
-            start = end - chunk_overlap
-        return chunks
+        # Split di batas paragraf/kalimat dulu, baru turun ke spasi/karakter
+        return _get_splitter(chunk_size, chunk_overlap).split_text(text)
+
+# PDFium tidak thread-safe, akses dari upload yang bersamaan harus serial
+_pdfium_lock = threading.Lock()
 
 class PDFProcessor(DocumentProcessor):
-    def process(self, file_path: str, **kwargs) -> List[str]:
-        # Implement PDF processing dengan PyPDF2 atau pdfplumber
+    def process(self, file_or_path: Union[str, IO[bytes]], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+        # PDFium (C++) jauh lebih cepat dari PyPDF2 untuk PDF besar
         try:
-            import PyPDF2
-            chunks = []
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    text = page.extract_text()
-                    if text.strip():
-                        chunks.append(text)
-            return chunks
+            import pypdfium2 as pdfium
         except ImportError:
-            raise ImportError("PyPDF2 required for PDF processing")
+            raise ImportError("pypdfium2 required for PDF processing")
+
+        pages = []
+        with _pdfium_lock:
+            # PdfDocument menerima path maupun file-like object
+            pdf = pdfium.PdfDocument(file_or_path)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    pages.append(textpage.get_text_bounded())
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
+
+        # Chunk seluruh dokumen, bukan satu chunk per halaman
+        text = "\n\n".join(pages)
+        return _get_splitter(chunk_size, chunk_overlap).split_text(text)
+
+# Processor stateless, cukup satu instance per tipe file
+_PROCESSORS = {
+    '.txt': TextProcessor(),
+    '.pdf': PDFProcessor(),
+    # Tambahkan processor lain
+}
 
 class DocumentProcessorFactory:
     @staticmethod
     def get_processor(file_extension: str) -> DocumentProcessor:
-        processors = {
-            '.txt': TextProcessor(),
-            '.pdf': PDFProcessor(),
-            # Tambahkan processor lain
-        }
-        
-        if file_extension not in processors:
+        if file_extension not in _PROCESSORS:
             raise ValueError(f"Unsupported file type: {file_extension}")
         
-        return processors[file_extension]
\ No newline at end of file
+        return _PROCESSORS[file_extension]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
 
 class VectorDBInterface(ABC):
     @abstractmethod
@@ -7,16 +8,54 @@ class VectorDBInterface(ABC):
         pass
     
     @abstractmethod
-    def search(self, query: str, limit: int) -> List[Dict]:
+    async def aadd_documents(self, documents: List[str], metadata: List[dict]) -> None:
+        pass
+    
+    @abstractmethod
+    async def search(self, query: str, limit: int) -> List[Dict]:
         pass
 
 class EmbeddingInterface(ABC):
     @abstractmethod
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def embed_documents(self, texts: List[str]) -> Union[np.ndarray, List[List[float]]]:
+        pass
+    
+    @abstractmethod
+    def embed_query(self, text: str) -> Union[np.ndarray, List[float]]:
+        pass
+    
+    def cached_query(self, text: str) -> Optional[Union[np.ndarray, List[float]]]:
+        """Embedding query yang sudah di-cache, None jika belum ada"""
+        return None
+
+class ConversationStoreInterface(ABC):
+    @abstractmethod
+    async def create_conversation(self) -> str:
+        pass
+    
+    @abstractmethod
+    async def add_message(self, conversation_id: str, role: str, content: str, metadata: Optional[Dict] = None) -> None:
+        pass
+    
+    @abstractmethod
+    async def add_message_pair(self, conversation_id: str, user_content: str, user_metadata: Optional[Dict],
+                               assistant_content: str, assistant_metadata: Optional[Dict]) -> None:
+        pass
+    
+    @abstractmethod
+    async def get_conversation_history(self, conversation_id: str, limit: Optional[int] = None) -> List[Any]:
+        pass
+    
+    async def get_recent_context(self, conversation_id: str, max_messages: int = 3) -> List[Any]:
+        """Get recent messages for context (internal use only)"""
+        return await self.get_conversation_history(conversation_id, max_messages)
+    
+    @abstractmethod
+    async def conversation_exists(self, conversation_id: str) -> bool:
         pass
     
     @abstractmethod
-    def embed_query(self, text: str) -> List[float]:
+    async def delete_conversation(self, conversation_id: str) -> bool:
         pass
 
 class LLMInterface(ABC):
@@ -1,18 +1,22 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List, Optional
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional
+import asyncio
 import os
 
-from database import vector_db, VectorDBFactory
-from models import Document, Query, RAGResponse, HealthCheck, SearchResult
+from database import QdrantVectorDB, get_db
+from models import Document, Query, RAGResponse, HealthCheck, SearchResult, ConversationHistory
 from utils import format_sources, generate_response_with_ollama, check_ollama_health, build_enhanced_query, generate_stream_response_with_ollama
 from document_processors import DocumentProcessorFactory
-from conversation_manager import conversation_manager
+from conversation_manager import conversation_manager, Message
+from services import ingest_documents
 
 app = FastAPI(
     title="RAG System API",
     description="Retrieval-Augmented Generation dengan FastAPI, Qdrant, dan Ollama dengan Conversation Context",
-    version="1.1.0"
+    version="1.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -24,21 +28,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Background task untuk cleanup
+# Di-set saat startup, bukan saat import module
+vector_db: Optional[QdrantVectorDB] = None
 
 
 @app.on_event("startup")
-async def startup_event():
-    import asyncio
-
-    async def periodic_cleanup():
-        while True:
-            await asyncio.sleep(3600)  # setiap jam
-            cleaned = conversation_manager.cleanup_expired_conversations()
-            if cleaned > 0:
-                print(f"Cleaned up {cleaned} expired conversations")
-
-    asyncio.create_task(periodic_cleanup())
+async def load_vector_db():
+    """Load embedding model + Qdrant client dan warm up sebelum request pertama"""
+    global vector_db
+    vector_db = await asyncio.to_thread(get_db)
+    # Encode dummy agar inisialisasi torch tidak masuk latency request pertama
+    await asyncio.to_thread(vector_db.embedder.embed_documents, ["warmup"])
 
 
 @app.get("/", tags=["Health"])
@@ -50,12 +50,13 @@ async def root():
 async def health_check():
     """Check system health"""
     try:
-        qdrant_info = vector_db.get_collection_info()
+        qdrant_info = await vector_db.get_collection_info()
         qdrant_status = "healthy"
     except:
         qdrant_status = "unhealthy"
 
-    ollama_status = check_ollama_health()
+    # ollama.list() blocking saat cache miss, jalankan di thread
+    ollama_status = await asyncio.to_thread(check_ollama_health)
 
     return HealthCheck(
         status="healthy" if qdrant_status == "healthy" and ollama_status == "healthy" else "degraded",
@@ -68,16 +69,11 @@ async def health_check():
 async def add_documents(documents: List[Document], collection: str = None):
     """Add documents to specified or default collection"""
     try:
-        db_instance = vector_db
-        if collection:
-            db_instance = VectorDBFactory.create_vector_db(
-                collection_name=collection)
-
         texts = [doc.text for doc in documents]
         metadata = [doc.metadata for doc in documents]
 
-        db_instance.add_documents(texts, metadata)
-        return {"message": f"Added {len(documents)} documents to {collection or 'default'} collection"}
+        count = await ingest_documents(texts, metadata, collection)
+        return {"message": f"Added {count} documents to {collection or 'default'} collection"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -94,17 +90,14 @@ async def upload_file(
         file_extension = os.path.splitext(file.filename)[1].lower()
         processor = DocumentProcessorFactory.get_processor(file_extension)
 
-        with open(f"temp_{file.filename}", "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        chunks = processor.process(
-            f"temp_{file.filename}", chunk_size, chunk_overlap)
+        # UploadFile sudah di-spool ke disk per chunk oleh Starlette,
+        # baca langsung dari file-nya tanpa menyalin seluruh isi ke RAM
+        await file.seek(0)
+        # Parsing + chunking CPU-bound, jalankan di thread agar event loop bebas
+        chunks = await asyncio.to_thread(
+            processor.process, file.file, chunk_size, chunk_overlap)
 
-        os.remove(f"temp_{file.filename}")
-
-        documents = [Document(text=chunk) for chunk in chunks]
-        await add_documents(documents, collection)
+        await ingest_documents(chunks, [None] * len(chunks), collection)
 
         return {"message": f"Processed {len(chunks)} chunks from {file.filename}"}
     except Exception as e:
@@ -115,15 +108,16 @@ async def upload_file(
 async def search_documents(query: Query):
     """Search for similar documents"""
     try:
-        results = vector_db.search(query.question, query.top_k)
-        return format_sources(results)
+        results = await vector_db.search(query.question, query.top_k)
+        # Data internal sudah sesuai schema, lewati validasi response_model
+        return ORJSONResponse(format_sources(results))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error searching: {str(e)}")
 
 
 from fastapi.responses import StreamingResponse
-import json
+import orjson
 from models import StreamResponse, StreamOption
 
 @app.post("/ask", response_model=RAGResponse, tags=["RAG"])
@@ -134,15 +128,15 @@ async def ask_question(query: Query, background_tasks: BackgroundTasks):
         conversation_id = query.conversation_id
 
         # Validasi conversation ID
-        if conversation_id and not conversation_manager.conversation_exists(conversation_id):
+        if conversation_id and not await conversation_manager.conversation_exists(conversation_id):
             conversation_id = None
 
         # Buat conversation baru jika tidak ada ID yang valid
         if not conversation_id:
-            conversation_id = conversation_manager.create_conversation()
+            conversation_id = await conversation_manager.create_conversation()
 
         # Dapatkan conversation history secara internal
-        conversation_history = conversation_manager.get_recent_context(
+        conversation_history = await conversation_manager.get_recent_context(
             conversation_id, max_messages=3)
 
         # Enhance query secara internal menggunakan history
@@ -155,78 +149,49 @@ async def ask_question(query: Query, background_tasks: BackgroundTasks):
         print(f"Stream: {query.stream}")
 
         # 1. Retrieve relevant documents dengan enhanced query
-        results = vector_db.search(enhanced_query, query.top_k)
+        results = await vector_db.search(enhanced_query, query.top_k)
 
         print(f"Search results: {len(results)} documents found")
 
-        # Handle no relevant documents
+        # Handle no relevant documents (tidak ada yang lolos threshold)
         if not results:
-            response = RAGResponse(
-                answer="Maaf, saya tidak menemukan informasi yang relevan tentang pertanyaan Anda di dokumentasi API Telkom.",
-                sources=[],
-                question=query.question,
-                conversation_id=conversation_id
-            )
+            answer = "Maaf, saya tidak menemukan informasi yang relevan tentang pertanyaan Anda di dokumentasi API Telkom."
 
             background_tasks.add_task(
-                conversation_manager.add_message,
+                conversation_manager.add_message_pair,
                 conversation_id,
-                "user",
                 query.question,
+                {"has_relevant_docs": False},
+                answer,
                 {"has_relevant_docs": False}
             )
-            background_tasks.add_task(
-                conversation_manager.add_message,
-                conversation_id,
-                "assistant",
-                response.answer,
-                {"has_relevant_docs": False}
-            )
-
-            return response
-
-        # 2. Cek similarity score
-        max_score = max([result["score"] for result in results])
-        if max_score < 0.3:
-            response = RAGResponse(
-                answer="Maaf, informasi yang saya miliki tidak cukup relevan untuk menjawab pertanyaan tersebut.",
-                sources=format_sources(results),
-                question=query.question,
-                conversation_id=conversation_id
-            )
 
-            background_tasks.add_task(
-                conversation_manager.add_message,
-                conversation_id,
-                "user",
-                query.question,
-                {"has_relevant_docs": False, "max_score": max_score}
-            )
-            background_tasks.add_task(
-                conversation_manager.add_message,
-                conversation_id,
-                "assistant",
-                response.answer,
-                {"has_relevant_docs": False, "max_score": max_score}
-            )
+            return ORJSONResponse({
+                "answer": answer,
+                "sources": [],
+                "question": query.question,
+                "conversation_id": conversation_id
+            })
 
-            return response
+        # Qdrant sudah membuang hasil di bawah similarity threshold dan
+        # mengurutkan berdasarkan score, jadi hasil pertama adalah max score
+        max_score = results[0]["score"]
 
-        # 3. Prepare context
+        # 2. Prepare context
         context = "\n\n".join(
-            [f"Source {i+1} (relevansi: {result['score']:.2f}):\n{result['text']}"
-             for i, result in enumerate(results)])
+            f"Source {i} (relevansi: {result['score']:.2f}):\n{result['text']}"
+            for i, result in enumerate(results, 1))
 
-        # 4. Handle streaming vs non-streaming
+        # 3. Handle streaming vs non-streaming
         if query.stream == StreamOption.TRUE:
             return await handle_streaming_response(
                 context, query.question, conversation_history, 
-                results, conversation_id, background_tasks
+                results, max_score, conversation_id, background_tasks
             )
         else:
             return await handle_normal_response(
                 context, query.question, conversation_history,
-                results, conversation_id, background_tasks
+                results, max_score, conversation_id, background_tasks
             )
 
     except Exception as e:
@@ -234,44 +199,47 @@ async def ask_question(query: Query, background_tasks: BackgroundTasks):
         raise HTTPException(
             status_code=500, detail=f"Error generating response: {str(e)}")
 
-async def handle_normal_response(context: str, question: str, conversation_history: List[Dict],
-                               results: List, conversation_id: str, background_tasks: BackgroundTasks):
+async def handle_normal_response(context: str, question: str, conversation_history: List[Message],
+                               results: List, max_score: float, conversation_id: str,
+                               background_tasks: BackgroundTasks):
     """Handle non-streaming response"""
-    answer = generate_response_with_ollama(
+    answer = await generate_response_with_ollama(
         context, question, conversation_history)
 
-    response = RAGResponse(
-        answer=answer,
-        sources=format_sources(results),
-        question=question,
-        conversation_id=conversation_id
-    )
-
     # Simpan ke conversation history
-    max_score = max([result["score"] for result in results])
     background_tasks.add_task(
-        conversation_manager.add_message,
+        conversation_manager.add_message_pair,
         conversation_id,
-        "user",
         question,
-        {"has_relevant_docs": True, "doc_count": len(results), "max_score": max_score}
-    )
-    background_tasks.add_task(
-        conversation_manager.add_message,
-        conversation_id,
-        "assistant",
+        {"has_relevant_docs": True, "doc_count": len(results), "max_score": max_score},
         answer,
         {"has_relevant_docs": True, "sources_count": len(results)}
     )
 
-    return response
-
-async def handle_streaming_response(context: str, question: str, conversation_history: List[Dict],
-                                  results: List, conversation_id: str, background_tasks: BackgroundTasks):
+    # Dict sudah berbentuk RAGResponse, dikirim tanpa validasi ulang
+    return ORJSONResponse({
+        "answer": answer,
+        "sources": format_sources(results),
+        "question": question,
+        "conversation_id": conversation_id
+    })
+
+async def handle_streaming_response(context: str, question: str, conversation_history: List[Message],
+                                  results: List, max_score: float, conversation_id: str,
+                                  background_tasks: BackgroundTasks):
     """Handle streaming response"""
     
+    # Envelope statis di-serialisasi sekali, per token cukup encode token-nya
+    token_prefix = (b'data: {"conversation_id":' + orjson.dumps(conversation_id)
+                    + b',"is_final":false,"token":')
+    token_suffix = b"}\n\n"
+
+    def final_event(token: str) -> bytes:
+        return b"data: " + orjson.dumps(
+            {"conversation_id": conversation_id, "is_final": True, "token": token}) + b"\n\n"
+
     async def generate_stream():
-        full_answer = ""
+        answer_parts: List[str] = []
         try:
             # Generate streaming response
             stream = generate_stream_response_with_ollama(
@@ -279,32 +247,27 @@ async def handle_streaming_response(context: str, question: str, conversation_hi
             )
             
             # Stream tokens
-            for token in stream:
-                full_answer += token
-                yield f"data: {json.dumps({'token': token, 'conversation_id': conversation_id, 'is_final': False})}\n\n"
+            async for token in stream:
+                answer_parts.append(token)
+                yield token_prefix + orjson.dumps(token) + token_suffix
             
             # Final message
-            yield f"data: {json.dumps({'token': '', 'conversation_id': conversation_id, 'is_final': True})}\n\n"
+            yield final_event("")
             
         except Exception as e:
             error_msg = "Error: Sistem sedang gangguan."
-            yield f"data: {json.dumps({'token': error_msg, 'conversation_id': conversation_id, 'is_final': True})}\n\n"
-            full_answer = error_msg
+            yield final_event(error_msg)
+            answer_parts = [error_msg]
         
         finally:
+            full_answer = "".join(answer_parts)
+
             # Save to conversation history in background
-            max_score = max([result["score"] for result in results])
             background_tasks.add_task(
-                conversation_manager.add_message,
+                conversation_manager.add_message_pair,
                 conversation_id,
-                "user",
                 question,
-                {"has_relevant_docs": True, "doc_count": len(results), "max_score": max_score}
-            )
-            background_tasks.add_task(
-                conversation_manager.add_message,
-                conversation_id,
-                "assistant",
+                {"has_relevant_docs": True, "doc_count": len(results), "max_score": max_score},
                 full_answer,
                 {"has_relevant_docs": True, "sources_count": len(results)}
             )
@@ -321,20 +284,20 @@ async def handle_streaming_response(context: str, question: str, conversation_hi
     )
 
 
-@app.get("/conversations/{conversation_id}", tags=["Conversations"])
+@app.get("/conversations/{conversation_id}", response_model=ConversationHistory, tags=["Conversations"])
 async def get_conversation(conversation_id: str):
     """Get conversation history (untuk debugging/admin purposes)"""
     try:
-        if not conversation_manager.conversation_exists(conversation_id):
+        if not await conversation_manager.conversation_exists(conversation_id):
             raise HTTPException(
                 status_code=404, detail="Conversation not found")
 
-        history = conversation_manager.get_conversation_history(
+        history = await conversation_manager.get_conversation_history(
             conversation_id)
         return {
             "conversation_id": conversation_id,
             "message_count": len(history),
-            "messages": history
+            "messages": [message.to_dict() for message in history]
         }
     except HTTPException:
         raise
@@ -346,10 +309,7 @@ async def get_conversation(conversation_id: str):
 async def delete_conversation(conversation_id: str):
     """Delete conversation"""
     try:
-        if conversation_manager.conversation_exists(conversation_id):
-            # Dalam implementasi sebenarnya, kita akan hapus dari storage
-            # Untuk sekarang, kita set sebagai expired
-            conversation_manager.cleanup_expired_conversations()
+        if await conversation_manager.delete_conversation(conversation_id):
             return {"message": f"Conversation {conversation_id} deleted"}
         else:
             raise HTTPException(
@@ -364,7 +324,7 @@ async def delete_conversation(conversation_id: str):
 async def get_collection_info():
     """Get information about the vector database collection"""
     try:
-        info = vector_db.get_collection_info()
+        info = await vector_db.get_collection_info()
         return {
             "collection_name": info.config.params.vectors.size,
             "vector_size": info.config.params.vectors.size,
@@ -1,5 +1,6 @@
+from datetime import datetime
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
 
@@ -26,22 +27,30 @@ class RAGResponse(BaseModel):
     conversation_id: Optional[str] = None
 
 
+class ConversationMessage(BaseModel):
+    role: str
+    content: str
+    # Disimpan sebagai epoch float, diserialisasi sebagai ISO 8601
+    timestamp: datetime
+    metadata: Dict[str, Any] = {}
+
+
+class ConversationHistory(BaseModel):
+    conversation_id: str
+    message_count: int
+    messages: List[ConversationMessage]
+
+
 class HealthCheck(BaseModel):
     status: str
     qdrant_status: str
     ollama_status: str
 
 
-# Tambahkan model untuk conversation context
-class ConversationContext(BaseModel):
-    conversation_id: Optional[str] = None
-    previous_messages: List[Dict] = []
-    max_history: int = 5
-
-
 class Query(BaseModel):
     question: str
-    top_k: Optional[int] = 3
+    # Dibatasi supaya satu request tidak menggagalkan batch search lain
+    top_k: int = Field(3, ge=1, le=10)
     conversation_id: Optional[str] = None
     stream: Optional[StreamOption] = StreamOption.FALSE
 
@@ -0,0 +1,12 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from database import get_db
+
+
+async def ingest_documents(texts: List[str], metadata: List[Optional[Dict]], collection: Optional[str] = None) -> int:
+    """Embed and store texts in the given (or default) collection"""
+    # Collection baru dibuat lewat client sync, jangan blok event loop
+    db_instance = await asyncio.to_thread(get_db, collection)
+    await db_instance.aadd_documents(texts, metadata)
+    return len(texts)
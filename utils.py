@@ -1,83 +1,85 @@
 import ollama
-from typing import Generator, List, Dict
+from cachetools.func import ttl_cache
+from typing import AsyncGenerator, List, Dict
 
+from conversation_manager import Message
+
+_async_client = ollama.AsyncClient()
+
+# Persona statis di awal konteks supaya prefix KV cache Ollama bisa di-reuse
+SYSTEM_PROMPT = "Anda adalah AXEL, asisten dokumentasi API Telkom. Jawab pertanyaan dengan SINGKAT, PADAT, langsung ke inti. Hindari salam pembuka, penutup, atau kata-kata tidak perlu. Fokus pada informasi teknis yang diminta."
+
+_ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+GENERATE_OPTIONS = {
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "num_ctx": 4096
+}
+
+# Potongan template prompt, cukup digabung dengan "".join setiap request
+_PROMPT_QUESTION = "Pertanyaan: "
+_PROMPT_HISTORY = "\n\nRiwayat Percakapan Terkait:\n"
+_PROMPT_CONTEXT = "\nDokumentasi relevan:\n"
+_PROMPT_ANSWER = "\n\nJawaban:"
 
-def generate_response_with_ollama(context: str, question: str, conversation_history: List[Dict] = None, model: str = "llama3:8b") -> str:
-    """
-    Generate response as AXEL - Direct and to the point
-    """
-    history_context = ""
-    if conversation_history:
-        history_context = "\n\nRiwayat Percakapan Terkait:\n"
-        for msg in conversation_history:
-            role = "User" if msg.get("role") == "user" else "Assistant"
-            history_context += f"{role}: {msg.get('content', '')}\n"
 
-    prompt = f"""Berdasarkan informasi dokumentasi berikut:
+def _build_prompt(context: str, question: str, conversation_history: List[Message] = None) -> str:
+    """Prompt yang sama untuk response normal maupun streaming"""
+    history_context = "".join(
+        f"{_ROLE_LABELS.get(msg.role, 'Assistant')}: {msg.content}\n"
+        for msg in conversation_history
+    ) if conversation_history else ""
 
-{context}
-{history_context}
+    # Bagian statis (persona) ada di system prompt, bagian dinamis di prompt
+    return "".join((
+        _PROMPT_QUESTION, question,
+        _PROMPT_HISTORY, history_context,
+        _PROMPT_CONTEXT, context,
+        _PROMPT_ANSWER
+    ))
 
-Jawab pertanyaan ini dengan singkat dan langsung ke intinya: {question}
 
-Jawaban:"""
+async def generate_response_with_ollama(context: str, question: str, conversation_history: List[Message] = None, model: str = "llama3:8b") -> str:
+    """
+    Generate response as AXEL - Direct and to the point
+    """
+    prompt = _build_prompt(context, question, conversation_history)
 
     try:
-        response = ollama.generate(
+        response = await _async_client.generate(
             model=model,
             prompt=prompt,
-            options={
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "num_ctx": 4096,
-                "system": "Anda adalah AXEL, asisten dokumentasi API Telkom. Jawab pertanyaan dengan SINGKAT, PADAT, langsung ke inti. Hindari salam pembuka, penutup, atau kata-kata tidak perlu. Fokus pada informasi teknis yang diminta."
-            }
+            system=SYSTEM_PROMPT,
+            options=GENERATE_OPTIONS
         )
         return response['response'].strip()
     except Exception as e:
         return "Error: Sistem sedang gangguan."
 
-def generate_stream_response_with_ollama(context: str, question: str, conversation_history: List[Dict] = None, model: str = "llama3:8b") -> Generator[str, None, None]:
+async def generate_stream_response_with_ollama(context: str, question: str, conversation_history: List[Message] = None, model: str = "llama3:8b") -> AsyncGenerator[str, None]:
     """
     Generate streaming response as AXEL
     """
-    history_context = ""
-    if conversation_history:
-        history_context = "\n\nRiwayat Percakapan Terkait:\n"
-        for msg in conversation_history:
-            role = "User" if msg.get("role") == "user" else "Assistant"
-            history_context += f"{role}: {msg.get('content', '')}\n"
-
-    prompt = f"""Berdasarkan informasi dokumentasi berikut:
-
-{context}
-{history_context}
-
-Jawab pertanyaan ini dengan singkat dan langsung ke intinya: {question}
-
-Jawaban:"""
+    prompt = _build_prompt(context, question, conversation_history)
 
     try:
-        stream = ollama.generate(
+        stream = await _async_client.generate(
             model=model,
             prompt=prompt,
             stream=True,  # Enable streaming
-            options={
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "num_ctx": 4096,
-                "system": "Anda adalah AXEL, asisten dokumentasi API Telkom. Jawab pertanyaan dengan SINGKAT, PADAT, langsung ke inti. Hindari salam pembuka, penutup, atau kata-kata tidak perlu. Fokus pada informasi teknis yang diminta."
-            }
+            system=SYSTEM_PROMPT,
+            options=GENERATE_OPTIONS
         )
         
-        for chunk in stream:
+        async for chunk in stream:
             if 'response' in chunk:
                 yield chunk['response']
                 
     except Exception as e:
         yield "Error: Sistem sedang gangguan."
 
-def build_enhanced_query(question: str, conversation_history: List[Dict]) -> str:
+def build_enhanced_query(question: str, conversation_history: List[Message]) -> str:
     """
     Build enhanced query menggunakan conversation history (internal)
     """
@@ -86,8 +88,8 @@ def build_enhanced_query(question: str, conversation_history: List[Dict]) -> str
     
     # Ambil pesan user terakhir untuk konteks
     recent_user_messages = [
-        msg.get("content", "") for msg in conversation_history[-2:] 
-        if msg.get("role") == "user"
+        msg.content for msg in conversation_history[-2:] 
+        if msg.role == "user"
     ]
     
     if len(recent_user_messages) > 1:
@@ -98,13 +100,13 @@ def build_enhanced_query(question: str, conversation_history: List[Dict]) -> str
     return question
 
 
+# Liveness probe memanggil /health tiap beberapa detik, cukup cek Ollama tiap 10 detik
+@ttl_cache(maxsize=1, ttl=10)
 def check_ollama_health() -> str:
     """Check if Ollama is running and models are available"""
     try:
         models = ollama.list()
-        llama_models = [model for model in models['models']
-                        if 'llama3' in model['name']]
-        if llama_models:
+        if any('llama3' in model['name'] for model in models['models']):
             return "healthy"
         return "no llama model found"
     except:
@@ -113,11 +115,12 @@ def check_ollama_health() -> str:
 
 def format_sources(sources: List[Dict]) -> List[Dict]:
     """Format sources for response"""
+    # Score dikirim apa adanya, orjson yang menserialisasi float
     return [
         {
             "text": source["text"],
             "metadata": source.get("metadata") or {},
-            "score": round(source["score"], 4)
+            "score": source["score"]
         }
         for source in sources
-    ]
+    ]
\ No newline at end of file